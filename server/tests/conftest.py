@@ -0,0 +1,12 @@
+import os
+
+import pytest
+from dotenv import load_dotenv
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _env():
+    # Point DOTENV_PATH at the project's .env to run against the real Tonie cloud.
+    dotenv_path = os.getenv("DOTENV_PATH")
+    if dotenv_path and os.path.exists(dotenv_path):
+        load_dotenv(dotenv_path)
@@ -1,53 +1,93 @@
-import json
-from unittest.mock import Mock, patch
+import functools
+from types import SimpleNamespace
+from unittest.mock import Mock
 
+import orjson
 import pytest
-from app import app as application
-from dotenv import load_dotenv
-
-load_dotenv("/home/laudanum/projects/toniebox-audio-match/.env")
 
 # Mock the `get_item_from_request` and `g.tonie_api_client.get_tonie_content` functions
 # if they involve network calls or other side-effects you don't want in tests.
 
-mock_tonie1 = Mock(id="tonie_1")
-mock_tonie2 = Mock(id="tonie_2")
+mock_tonie1 = SimpleNamespace(id="tonie_1")
+mock_tonie2 = SimpleNamespace(id="tonie_2")
 
-def mock_get_item_from_request(*args, **kwargs):
-    if "valid_tonie" in args[0]["tonie_id"]:
-        return ["valid_tonie"]
-    return ["some_mocked_tonie_id_1", "some_mocked_tonie_id_2"]
+_PAYLOAD_INVALID_TONIE = orjson.dumps({"tonie_id": "invalid_tonie"})
+_PAYLOAD_MULTIPLE_TONIES = orjson.dumps({"tonie_id": ["tonie_1", "tonie_2"]})
+_PAYLOAD_VALID_TONIE = orjson.dumps({"tonie_id": "tonie_1"})
 
-@pytest.fixture
+_TONIE_CONTENT = {"chapters": ({"id": "track_1"}, {"id": "track_2"})}
+
+_TONIE_LOOKUP = {
+    ("tonie_1",): [mock_tonie1],
+    ("tonie_2",): [mock_tonie2],
+    ("tonie_1", "tonie_2"): [mock_tonie1, mock_tonie2],
+    ("invalid_tonie",): None,
+}
+
+def mock_get_item_from_request(req_json, item_key, items):
+    if item_key == "tonie_id":
+        tonie_ids = req_json["tonie_id"]
+        if not isinstance(tonie_ids, list):
+            tonie_ids = [tonie_ids]
+        return _TONIE_LOOKUP.get(tuple(tonie_ids))
+    return None
+
+# Importing app scans the media library, so defer it until a test actually runs
+# instead of paying for it during collection.
+@functools.lru_cache(maxsize=None)
+def _app_module():
+    import app
+
+    return app
+
+@pytest.fixture(scope="session")
 def client():
+    application = _app_module().app
     application.config['TESTING'] = True
-    with application.test_client() as client:
-        yield client
-
-def test_tonie_overview_invalid_tonie(client):
-    payload = json.dumps({"tonie_id": "invalid_tonie"})
-    rv = client.post("/tonie_overview", data=payload, content_type="application/json")
-    assert rv.status_code == 400
-    assert rv.json["status"] == "failure"
-    assert rv.json["message"] == "No matching tonie found"
-
-def test_tonie_overview_multiple_tonies(client):
-    mock_tonie1_dict = {'id': 'tonie_1', 'some_other_attribute': 'value1'}
-    mock_tonie2_dict = {'id': 'tonie_2', 'some_other_attribute': 'value2'}
-    payload = json.dumps({"tonie_id": [mock_tonie1_dict, mock_tonie2_dict]})
-
-    with patch('app.get_item_from_request', side_effect=mock_get_item_from_request):
-        rv = client.post("/tonie_overview", data=payload, content_type="application/json")
-        assert rv.status_code == 400
-        assert rv.json["status"] == "failure"
-        assert rv.json["message"] == "Multiple tonies provided, can only handle one"
-
-def test_tonie_overview_valid_tonie(client):
-    payload = json.dumps({"tonie_id": "valid_tonie"})    
-    with application.app_context(): 
-        with patch('app.get_item_from_request', side_effect=mock_get_item_from_request):
-            with patch('toniecloud.client.TonieCloud.get_tonie_content', Mock(return_value="test")):
-                rv = client.post("/tonie_overview", data=payload, content_type="application/json")
-                assert rv.status_code == 200
-                assert rv.json["status"] == "success"
-                assert "tracks" in rv.json
+    # Not entered as a context manager: a session-wide client must not keep
+    # the last request context pushed between tests.
+    return application.test_client()
+
+@pytest.fixture
+def toniecloud_patches(monkeypatch):
+    from toniecloud.client import TonieCloud
+
+    monkeypatch.setattr(_app_module(), 'get_item_from_request', mock_get_item_from_request)
+    monkeypatch.setattr(TonieCloud, 'get_tonie_content', Mock(return_value=_TONIE_CONTENT))
+
+def post_json(client, url, payload):
+    return client.post(url, data=payload, content_type="application/json")
+
+def _json(resp):
+    return orjson.loads(resp.data)
+
+@pytest.mark.parametrize(
+    "payload,status,expected,extra_fixture",
+    [
+        (
+            _PAYLOAD_INVALID_TONIE,
+            400,
+            {"status": "failure", "message": "No matching tonie found"},
+            None,
+        ),
+        (
+            _PAYLOAD_MULTIPLE_TONIES,
+            400,
+            {"status": "failure", "message": "Multiple tonies provided, can only handle one"},
+            "toniecloud_patches",
+        ),
+        (
+            _PAYLOAD_VALID_TONIE,
+            200,
+            {"status": "success", "tracks": {"chapters": [{"id": "track_1"}, {"id": "track_2"}]}},
+            "toniecloud_patches",
+        ),
+    ],
+    ids=["invalid_tonie", "multiple_tonies", "valid_tonie"],
+)
+def test_tonie_overview(client, request, payload, status, expected, extra_fixture):
+    if extra_fixture:
+        request.getfixturevalue(extra_fixture)
+    rv = post_json(client, "/tonie_overview", payload)
+    assert rv.status_code == status
+    assert _json(rv) == expected